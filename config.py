@@ -0,0 +1,13 @@
+import json, os
+from functools import lru_cache
+
+CONFIG_PATH = "config.json"
+
+@lru_cache(maxsize=1)
+def _load_config(path, mtime):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def get_config(path=CONFIG_PATH):
+    """读取配置（带缓存，仅在文件修改时间变化时重新加载）"""
+    return _load_config(path, os.stat(path).st_mtime)
@@ -1,8 +1,8 @@
 import sqlite3
-import json
+from config import get_config
 
 # 读取配置
-CONFIG = json.load(open("config.json", encoding="utf-8"))
+CONFIG = get_config()
 DB_PATH = CONFIG["sqlite"]
 
 def create_indexes():
@@ -15,10 +15,14 @@ def create_indexes():
 
     for table in tables:
         try:
-            # 索引1：设备号+时间
-            cur.execute(f"CREATE INDEX IF NOT EXISTS idx_sn_time_{table} ON {table}(FD_INFO_SN, FD_LAST_TM)")
-            # 索引2：温度
-            cur.execute(f"CREATE INDEX IF NOT EXISTS idx_temp_{table} ON {table}(FD_TEMPERATURE)")
+            # 索引1：设备号+时间倒序+温度（覆盖按设备查询和曲线查询，无需回表）
+            cur.execute(f"CREATE INDEX IF NOT EXISTS idx_sn_timedesc_temp_{table} ON {table}(FD_INFO_SN, FD_LAST_TM DESC, FD_TEMPERATURE)")
+            # 旧的设备号+时间索引已被索引1覆盖，删除以减少写入开销
+            cur.execute(f"DROP INDEX IF EXISTS idx_sn_time_{table}")
+            # 温度索引已无查询使用，删除以减少写入开销
+            cur.execute(f"DROP INDEX IF EXISTS idx_temp_{table}")
+            # 索引2：时间（增量同步窗口）
+            cur.execute(f"CREATE INDEX IF NOT EXISTS idx_time_{table} ON {table}(FD_LAST_TM)")
             print(f"✅ {table} 已创建索引")
         except Exception as e:
             print(f"⚠️ {table} 创建索引失败: {e}")
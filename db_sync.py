@@ -1,9 +1,10 @@
-import pymysql, sqlite3, json, logging, re
+import pymysql, sqlite3, logging, re, threading
+from itertools import chain
 from dbutils.pooled_db import PooledDB   # 注意小写 dbutils
-from datetime import date
+from config import get_config
 
 # === 配置 ===
-CONFIG = json.load(open("config.json", encoding="utf-8"))
+CONFIG = get_config()
 
 # 日志（含 warning.log）
 logging.basicConfig(
@@ -17,6 +18,8 @@ logging.basicConfig(
 
 # === MySQL 连接池（延迟创建） ===
 mysql_pool = None
+# 并行同步的表数量；连接池的常驻空闲连接数与之一致，避免每轮同步反复建连/断连
+SYNC_WORKERS = 8
 
 def init_mysql_pool():
     """尝试初始化连接池"""
@@ -26,9 +29,9 @@ def init_mysql_pool():
     try:
         mysql_pool = PooledDB(
             creator=pymysql,
-            maxconnections=5,
-            mincached=1,
-            maxcached=3,
+            maxconnections=SYNC_WORKERS * 2,  # 留出余量给表列表查询等
+            mincached=SYNC_WORKERS,
+            maxcached=SYNC_WORKERS,
             blocking=True,
             ping=1,
             host=CONFIG["mysql"]["host"],
@@ -56,56 +59,263 @@ def get_mysql_conn():
     return None
 
 # === SQLite 本地缓存 ===
+# 多线程同步时串行化 SQLite 写入
+sqlite_write_lock = threading.Lock()
+
+# 已确认存在的表 / 已建好索引的表，避免每轮同步重复检查
+_tables_checked: set[str] = set()
+_indexes_checked: set[str] = set()
+# 本进程内已写入过 mo_summary 的表
+_summaries_checked: set[str] = set()
+# 远程表的列名（按定义顺序），每张表只查询一次
+_columns_cache: dict[str, list[str]] = {}
+# 拼好的 SELECT 语句缓存
+_select_sql_cache: dict[str, str] = {}
+
+# 去掉 MySQL 专有语法：表选项（ENGINE= 等）及其后全部内容、注释、索引方式、排序规则、反引号
+_DDL_CLEAN = re.compile(
+    r"(?:ENGINE=|AUTO_INCREMENT|CHARSET=|ROW_FORMAT=)[\s\S]*"
+    r"|(?i:COMMENT\s+'[^']*'|USING\s+BTREE|COLLATE\s+\w+)"
+    r"|InnoDB|`"
+)
+
+# 无法读取连接限制时使用的参数个数上限（SQLite 3.32 之前的默认值）
+SQLITE_DEFAULT_MAX_VARIABLES = 999
+# 每个事务写入的行数，避免 WAL 过大撑爆页缓存
+INSERT_BATCH_SIZE = 1000
+# 每次从 MySQL 流式读取的行数
+FETCH_CHUNK_SIZE = 5000
+
 def get_sqlite_conn():
-    return sqlite3.connect(CONFIG["sqlite"], timeout=30)
+    # 自动提交模式，事务由调用方显式 BEGIN/COMMIT 控制
+    conn = sqlite3.connect(CONFIG["sqlite"], timeout=30, isolation_level=None)
+    # WAL + NORMAL 同步，大幅减少写入时的 fsync 次数
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-65536")
+    conn.execute("PRAGMA mmap_size=268435456")
+    return conn
+
+def get_insert_sql(table, ncols, nrows):
+    """拼接一次插入 nrows 行的 INSERT 语句"""
+    row_sql = "(" + ",".join(["?"] * ncols) + ")"
+    return f"INSERT OR IGNORE INTO {table} VALUES " + ",".join([row_sql] * nrows)
+
+def get_max_variables(conn):
+    """SQLite 单条语句最多可绑定的参数个数（随编译选项和版本不同）"""
+    try:
+        return conn.getlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER)
+    except AttributeError:  # Python 3.11 之前没有 getlimit
+        return SQLITE_DEFAULT_MAX_VARIABLES
+
+def bulk_insert(conn, table, rows, ncols):
+    """多行 VALUES 批量插入，减少逐行绑定参数的开销"""
+    if not rows:
+        return
+    chunk = min(len(rows), get_max_variables(conn) // ncols)
+    sql = get_insert_sql(table, ncols, chunk)
+    full = len(rows) - len(rows) % chunk
+    for i in range(0, full, chunk):
+        conn.execute(sql, list(chain.from_iterable(rows[i:i + chunk])))
+
+    # 剩余不足一批的行
+    tail = rows[full:]
+    if tail:
+        conn.execute(get_insert_sql(table, ncols, len(tail)), list(chain.from_iterable(tail)))
 
 def ensure_index(sqlite_conn, table_name):
-    """为表创建必要索引，加快查询"""
+    """为表创建必要索引，加快查询；成功返回 True"""
+    if table_name in _indexes_checked:
+        return True
     try:
         cur = sqlite_conn.cursor()
-        cur.execute(f"CREATE INDEX IF NOT EXISTS idx_sn_time_{table_name} ON {table_name}(FD_INFO_SN, FD_LAST_TM)")
-        cur.execute(f"CREATE INDEX IF NOT EXISTS idx_temp_{table_name} ON {table_name}(FD_TEMPERATURE)")
-        sqlite_conn.commit()
+        # idx_sn_time 已被 idx_sn_timedesc_temp 覆盖，删除以减少写入开销
+        cur.execute(f"DROP INDEX IF EXISTS idx_sn_time_{table_name}")
+        # 超温统计改读 mo_warn_daily 后，已没有按温度筛选的查询，idx_temp 只增加写入开销
+        cur.execute(f"DROP INDEX IF EXISTS idx_temp_{table_name}")
+        cur.execute(f"CREATE INDEX IF NOT EXISTS idx_sn_timedesc_temp_{table_name} ON {table_name}(FD_INFO_SN, FD_LAST_TM DESC, FD_TEMPERATURE)")
+        cur.execute(f"CREATE INDEX IF NOT EXISTS idx_time_{table_name} ON {table_name}(FD_LAST_TM)")
+        _indexes_checked.add(table_name)
+        return True
     except Exception as e:
         logging.warning(f"创建索引失败 {table_name}: {e}")
+        return False
+
+def ensure_warn_trigger(sqlite_conn, table_name):
+    """创建超温预警触发器：新插入的当天超温记录直接写入 warnings 表；成功返回 True
+
+    warnings 只是待输出到 warning.log 的队列，sync_table 输出后即删除，不会无限增长；
+    网页端的超温统计读的是 mo_warn_daily。
+    """
+    try:
+        sqlite_conn.execute("""
+            CREATE TABLE IF NOT EXISTS warnings (
+                id INTEGER PRIMARY KEY,
+                table_name TEXT,
+                sn TEXT,
+                temp REAL,
+                tm TEXT
+            )
+        """)
+        # 每次启动重建触发器，使配置中的阈值修改生效
+        threshold = float(CONFIG["temperature_threshold"])
+        sqlite_conn.execute("BEGIN")
+        sqlite_conn.execute(f"DROP TRIGGER IF EXISTS trg_warn_{table_name}")
+        sqlite_conn.execute(f"""
+            CREATE TRIGGER trg_warn_{table_name} AFTER INSERT ON {table_name}
+            WHEN NEW.FD_TEMPERATURE >= {threshold}
+             AND date(NEW.FD_LAST_TM) = date('now', 'localtime')
+            BEGIN
+                INSERT INTO warnings(table_name, sn, temp, tm)
+                VALUES ('{table_name}', NEW.FD_INFO_SN, NEW.FD_TEMPERATURE, NEW.FD_LAST_TM);
+            END
+        """)
+        sqlite_conn.execute("COMMIT")
+        return True
+    except Exception as e:
+        sqlite_conn.rollback()
+        logging.warning(f"创建预警触发器失败 {table_name}: {e}")
+        return False
+
+def ensure_sn_set(sqlite_conn, table_name):
+    """维护 mo_sn_set（订单下出现过的 SN 集合），设备数统计不再需要 COUNT(DISTINCT)；成功返回 True"""
+    try:
+        sqlite_conn.execute("""
+            CREATE TABLE IF NOT EXISTS mo_sn_set (
+                mo_name TEXT,
+                sn TEXT,
+                PRIMARY KEY (mo_name, sn)
+            ) WITHOUT ROWID
+        """)
+        exists = sqlite_conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='trigger' AND name=?",
+            (f"trg_sn_{table_name}",)
+        ).fetchone()
+        if exists:
+            return True
+        # 首次创建触发器时补录已有数据
+        sqlite_conn.execute("BEGIN")
+        sqlite_conn.execute(f"""
+            CREATE TRIGGER trg_sn_{table_name} AFTER INSERT ON {table_name}
+            WHEN NEW.FD_INFO_SN IS NOT NULL
+            BEGIN
+                INSERT OR IGNORE INTO mo_sn_set(mo_name, sn) VALUES ('{table_name}', NEW.FD_INFO_SN);
+            END
+        """)
+        sqlite_conn.execute(f"""
+            INSERT OR IGNORE INTO mo_sn_set(mo_name, sn)
+            SELECT ?, FD_INFO_SN FROM {table_name}
+            WHERE FD_INFO_SN IS NOT NULL
+            GROUP BY FD_INFO_SN
+        """, (table_name,))
+        sqlite_conn.execute("COMMIT")
+        return True
+    except Exception as e:
+        sqlite_conn.rollback()
+        logging.warning(f"创建 SN 集合触发器失败 {table_name}: {e}")
+        return False
+
+def refresh_warn_daily(sqlite_conn, table_name, last_time):
+    """把 last_time 之后的数据合并进 mo_warn_daily（每订单每天每台 SN 的最高温度）"""
+    sqlite_conn.execute(f"""
+        INSERT INTO mo_warn_daily(mo_name, day, sn, max_temp)
+        SELECT ?, date(FD_LAST_TM), FD_INFO_SN, MAX(FD_TEMPERATURE)
+        FROM {table_name}
+        WHERE FD_LAST_TM > ?
+          AND FD_INFO_SN IS NOT NULL
+          AND FD_TEMPERATURE IS NOT NULL
+        GROUP BY date(FD_LAST_TM), FD_INFO_SN
+        ON CONFLICT(mo_name, day, sn) DO UPDATE SET max_temp = MAX(max_temp, excluded.max_temp)
+    """, (table_name, last_time))
+
+def ensure_warn_daily(sqlite_conn, table_name):
+    """确保 mo_warn_daily 存在，且已包含该表的历史数据；成功返回 True"""
+    try:
+        sqlite_conn.execute("""
+            CREATE TABLE IF NOT EXISTS mo_warn_daily (
+                mo_name TEXT,
+                day TEXT,
+                sn TEXT,
+                max_temp REAL,
+                PRIMARY KEY (mo_name, day, sn)
+            ) WITHOUT ROWID
+        """)
+        seeded = sqlite_conn.execute(
+            "SELECT 1 FROM mo_warn_daily WHERE mo_name=? LIMIT 1", (table_name,)
+        ).fetchone()
+        if not seeded:
+            refresh_warn_daily(sqlite_conn, table_name, "")
+        return True
+    except Exception as e:
+        logging.warning(f"初始化每日预警汇总失败 {table_name}: {e}")
+        return False
+
+def ensure_table_extras(sqlite_conn, table_name):
+    """为本地表建索引、触发器和汇总数据，全部成功才返回 True"""
+    results = [
+        ensure_index(sqlite_conn, table_name),
+        ensure_warn_trigger(sqlite_conn, table_name),
+        ensure_sn_set(sqlite_conn, table_name),
+        ensure_warn_daily(sqlite_conn, table_name),
+    ]
+    return all(results)
+
+def reset_schema_cache():
+    """本地库结构被重置（如删除缓存库）后调用，清空表结构相关的缓存"""
+    _tables_checked.clear()
+    _indexes_checked.clear()
+    _summaries_checked.clear()
+    _columns_cache.clear()
+    _select_sql_cache.clear()
 
 def ensure_table(sqlite_conn, table_name, mysql_conn):
     """确保本地 SQLite 有和远程一致的表结构（只在本地不存在时创建）"""
+    if table_name in _tables_checked:
+        return
     cur = sqlite_conn.cursor()
     cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (table_name,))
     exists = cur.fetchone()
     if exists:
-        # 确保已有表也有索引
-        ensure_index(sqlite_conn, table_name)
+        # 确保已有表也有索引和预警触发器；有失败则不缓存，下轮重试
+        if ensure_table_extras(sqlite_conn, table_name):
+            _tables_checked.add(table_name)
         return
 
     if not mysql_conn:
         logging.warning(f"无法创建表 {table_name}（MySQL 不可用）")
         return
 
+    # 每次都重新读取：走到这里说明本地表还不存在（或上次建表失败），远程结构可能已修正
     with mysql_conn.cursor() as cur:
         cur.execute(f"SHOW CREATE TABLE {table_name}")
         _, create_sql = cur.fetchone()
+    create_sql = _DDL_CLEAN.sub("", create_sql).strip()
 
-        # 去掉 MySQL 专有语法
-        for bad in ["ENGINE=", "AUTO_INCREMENT", "CHARSET=", "ROW_FORMAT="]:
-            if bad in create_sql:
-                create_sql = create_sql.split(bad)[0]
-
-        create_sql = create_sql.replace("InnoDB", "").strip()
-        create_sql = re.sub(r"COMMENT\s+'[^']*'", "", create_sql, flags=re.IGNORECASE)
-        create_sql = re.sub(r"USING\s+BTREE", "", create_sql, flags=re.IGNORECASE)
-        create_sql = create_sql.replace("`", "")  # 去掉反引号
-        create_sql = re.sub(r"COLLATE\s+\w+", "", create_sql, flags=re.IGNORECASE)
+    try:
+        sqlite_conn.execute(create_sql)
+        logging.info(f"本地新建表 {table_name}")
+        # 新建表后立刻加索引和预警触发器；有失败则不缓存，下轮重试
+        if ensure_table_extras(sqlite_conn, table_name):
+            _tables_checked.add(table_name)
+    except Exception as e:
+        logging.error(f"创建表 {table_name} 失败: {e}\nSQL: {create_sql}")
 
-        try:
-            sqlite_conn.execute(create_sql)
-            sqlite_conn.commit()
-            logging.info(f"本地新建表 {table_name}")
-            # 新建表后立刻加索引
-            ensure_index(sqlite_conn, table_name)
-        except Exception as e:
-            logging.error(f"创建表 {table_name} 失败: {e}\nSQL: {create_sql}")
+def get_table_columns(mysql_conn, table_name):
+    """获取远程表的完整列名列表（按建表顺序，带缓存）"""
+    cols = _columns_cache.get(table_name)
+    if cols:
+        return cols
+    with mysql_conn.cursor() as cur:
+        cur.execute(
+            "SELECT COLUMN_NAME FROM information_schema.columns "
+            "WHERE table_schema=%s AND table_name=%s ORDER BY ORDINAL_POSITION",
+            (CONFIG["mysql"]["database"], table_name)
+        )
+        cols = [row[0] for row in cur.fetchall()]
+    if cols:
+        _columns_cache[table_name] = cols
+    return cols
 
 def update_summary(sqlite_conn, table_name):
     """更新订单汇总信息到 mo_summary 表"""
@@ -117,18 +327,18 @@ def update_summary(sqlite_conn, table_name):
             warn_count INTEGER
         )
     """)
+    # 设备数取自 mo_sn_set，超温设备数取自 mo_warn_daily，最近时间走时间索引，均无需全表扫描
     sqlite_conn.execute(f"""
         INSERT OR REPLACE INTO mo_summary(mo_name, device_count, last_time, warn_count)
         VALUES (
             ?,
-            (SELECT COUNT(DISTINCT FD_INFO_SN) FROM {table_name}),
+            (SELECT COUNT(*) FROM mo_sn_set WHERE mo_name = ?),
             (SELECT MAX(FD_LAST_TM) FROM {table_name}),
-            (SELECT COUNT(DISTINCT FD_INFO_SN) 
-               FROM {table_name} 
-              WHERE FD_TEMPERATURE >= ?)
+            (SELECT COUNT(DISTINCT sn)
+               FROM mo_warn_daily
+              WHERE mo_name = ? AND max_temp >= ?)
         )
-    """, (table_name, CONFIG["temperature_threshold"]))
-    sqlite_conn.commit()
+    """, (table_name, table_name, table_name, CONFIG["temperature_threshold"]))
 
 def sync_table(table_name, last_time):
     """同步单个表的数据，并在同步时做温度预警（只预警当天数据）"""
@@ -138,52 +348,93 @@ def sync_table(table_name, last_time):
         return 0
 
     sqlite_conn = get_sqlite_conn()
-    ensure_table(sqlite_conn, table_name, mysql_conn)
-
-    with mysql_conn.cursor() as cur:
-        cur.execute(
-            f"SELECT * FROM {table_name} WHERE FD_LAST_TM > %s ORDER BY FD_LAST_TM",
-            (last_time,)
-        )
-        rows = cur.fetchall()
-        col_names = [desc[0] for desc in cur.description]
-
-        if rows:
-            placeholders = ",".join(["?"] * len(rows[0]))
-            sqlite_conn.executemany(
-                f"INSERT OR IGNORE INTO {table_name} VALUES ({placeholders})", rows
-            )
-            sqlite_conn.commit()
+    try:
+        with sqlite_write_lock:
+            ensure_table(sqlite_conn, table_name, mysql_conn)
+        if table_name not in _tables_checked:
+            # 没有触发器时写入的数据会漏掉预警，本轮放弃，保持同步时间不前进以便重试
+            raise RuntimeError(f"本地表 {table_name} 初始化未完成，跳过本轮同步")
 
-            # 确保插入数据后索引存在
-            ensure_index(sqlite_conn, table_name)
+        col_names = get_table_columns(mysql_conn, table_name)
+        if not col_names:
+            logging.warning(f"无法获取表 {table_name} 的列信息，跳过同步")
+            return 0
+        ncols = len(col_names)
+        select_sql = _select_sql_cache.get(table_name)
+        if select_sql is None:
+            select_cols = ",".join(f"`{c}`" for c in col_names)
+            select_sql = f"SELECT {select_cols} FROM {table_name} WHERE FD_LAST_TM > %s ORDER BY FD_LAST_TM"
+            _select_sql_cache[table_name] = select_sql
 
-            # 更新汇总表
-            update_summary(sqlite_conn, table_name)
+        # MySQL 查询可多线程并行；用 SSCursor 流式读取，按块写入 SQLite，内存占用与结果集大小无关
+        count = 0
+        with mysql_conn.cursor(pymysql.cursors.SSCursor) as cur:
+            cur.execute(select_sql, (last_time,))
+            while True:
+                chunk = cur.fetchmany(FETCH_CHUNK_SIZE)
+                if not chunk:
+                    break
+                # SQLite 写入串行执行，避免多线程争抢数据库写锁
+                with sqlite_write_lock:
+                    # 分批显式事务写入
+                    for i in range(0, len(chunk), INSERT_BATCH_SIZE):
+                        sqlite_conn.execute("BEGIN IMMEDIATE")
+                        try:
+                            bulk_insert(sqlite_conn, table_name, chunk[i:i + INSERT_BATCH_SIZE], ncols)
+                            sqlite_conn.execute("COMMIT")
+                        except Exception:
+                            # 失败时必须回滚，否则未结束的事务会一直占住 SQLite 写锁
+                            sqlite_conn.rollback()
+                            raise
+                count += len(chunk)
+        mysql_conn.close()  # 读完即归还连接池
 
-            # 温度预警（只处理当天数据）
-            if {"FD_INFO_SN", "FD_TEMPERATURE", "FD_LAST_TM"}.issubset(col_names):
-                sn_idx = col_names.index("FD_INFO_SN")
-                temp_idx = col_names.index("FD_TEMPERATURE")
-                time_idx = col_names.index("FD_LAST_TM")
+        # 有新数据，或本进程还没写过该表的汇总时，更新 mo_summary（首页只读这张表）
+        if count or table_name not in _summaries_checked:
+            # 索引、汇总等维护操作放在同一个事务中，只提交一次
+            with sqlite_write_lock:
+                sqlite_conn.execute("BEGIN")
+                try:
+                    # 确保插入数据后索引存在
+                    ensure_index(sqlite_conn, table_name)
 
-                today_str = str(date.today())
+                    # 合并本次新数据到每日最高温汇总
+                    refresh_warn_daily(sqlite_conn, table_name, last_time)
 
-                for r in rows:
-                    sn = r[sn_idx]
-                    temp = r[temp_idx]
-                    tm = r[time_idx]
+                    # 更新汇总表
+                    update_summary(sqlite_conn, table_name)
+                    sqlite_conn.execute("COMMIT")
+                except Exception:
+                    sqlite_conn.rollback()
+                    raise
+                _summaries_checked.add(table_name)
 
-                    if temp is not None and temp >= CONFIG["temperature_threshold"]:
-                        tm_date = str(tm).split(" ")[0]
-                        if tm_date == today_str:
-                            logging.warning(
-                                f"⚠️ 预警: 表={table_name}, SN={sn}, 温度={temp}, 时间={tm}"
-                            )
+        # 温度预警：超温记录已由触发器写入 warnings 表，输出到日志后即删除
+        warn_rows = sqlite_conn.execute(
+            "SELECT id, sn, temp, tm FROM warnings WHERE table_name = ? ORDER BY id",
+            (table_name,)
+        ).fetchall()
+        if warn_rows:
+            for _, sn, temp, tm in warn_rows:
+                logging.warning(
+                    f"⚠️ 预警: 表={table_name}, SN={sn}, 温度={temp}, 时间={tm}"
+                )
+            with sqlite_write_lock:
+                sqlite_conn.execute(
+                    "DELETE FROM warnings WHERE table_name = ? AND id <= ?",
+                    (table_name, warn_rows[-1][0])
+                )
 
-    mysql_conn.close()
-    sqlite_conn.close()
-    return len(rows)
+        return count
+    except sqlite3.OperationalError as e:
+        if "no such table" in str(e):
+            # 本地库被删除或重建：缓存的表结构已失效，清空后下轮同步重新建表
+            logging.warning(f"本地表结构已失效，重置缓存: {e}")
+            reset_schema_cache()
+        raise
+    finally:
+        mysql_conn.close()
+        sqlite_conn.close()
 
 def get_all_mo_tables():
     """查询远程数据库所有 tb_tt_tboard_mo* 表"""
@@ -1,8 +1,10 @@
-import json, logging
+import logging
+from concurrent.futures import ThreadPoolExecutor
 from apscheduler.schedulers.background import BackgroundScheduler
 from datetime import datetime
-from db_sync import sync_table, get_all_mo_tables
+from db_sync import sync_table, get_all_mo_tables, SYNC_WORKERS
 from webapp import app
+from config import get_config
 
 # 日志
 logging.basicConfig(
@@ -11,7 +13,7 @@ logging.basicConfig(
     handlers=[logging.StreamHandler()]
 )
 
-CONFIG = json.load(open("config.json", encoding="utf-8"))
+CONFIG = get_config()
 last_sync_time = "2000-01-01 00:00:00"  # 初始值
 
 
@@ -25,10 +27,12 @@ def sync_job():
             return
 
         logging.info(f"发现 {len(tables)} 个 MO 表需要同步")
-        for table in tables:
-            count = sync_table(table, last_sync_time)
-            if count > 0:
-                logging.info(f"表 {table} 同步 {count} 条新记录")
+        since = last_sync_time
+        with ThreadPoolExecutor(max_workers=SYNC_WORKERS) as executor:
+            counts = executor.map(lambda t: sync_table(t, since), tables)
+            for table, count in zip(tables, counts):
+                if count > 0:
+                    logging.info(f"表 {table} 同步 {count} 条新记录")
 
         # 更新时间戳
         last_sync_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
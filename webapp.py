@@ -1,13 +1,16 @@
 import os
+import queue
 import sqlite3
-from flask import Flask, render_template
-from datetime import datetime
-import json
+from flask import Flask, render_template, g
+from flask_compress import Compress
+from config import get_config
+import numpy as np
 
 app = Flask(__name__)
+Compress(app)  # gzip 压缩响应
 
 # 配置
-CONFIG = json.load(open("config.json", encoding="utf-8"))
+CONFIG = get_config()
 DB_PATH = CONFIG["sqlite"]
 
 # 全局状态记录
@@ -17,32 +20,62 @@ system_status = {
 }
 
 
+# 进程级 SQLite 连接池：开发服务器每个请求都是新线程，连接不能按线程保存
+DB_POOL_SIZE = 8
+_db_pool = queue.LifoQueue(maxsize=DB_POOL_SIZE)
+
+
+def get_db():
+    """从连接池获取当前请求使用的 SQLite 连接"""
+    if "db" not in g:
+        try:
+            conn = _db_pool.get_nowait()
+        except queue.Empty:
+            # journal_mode=WAL 由同步端设置（持久化在库文件中），这里只设连接级参数
+            conn = sqlite3.connect(DB_PATH, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA temp_store=MEMORY")
+            conn.execute("PRAGMA cache_size=-65536")
+            conn.execute("PRAGMA mmap_size=268435456")
+        g.db = conn
+    return g.db
+
+
+@app.teardown_appcontext
+def release_db(exc):
+    """请求结束时结束事务并把连接放回连接池"""
+    conn = g.pop("db", None)
+    if conn is None:
+        return
+    conn.rollback()
+    try:
+        _db_pool.put_nowait(conn)
+    except queue.Full:
+        conn.close()
+
+
 def query(sql, params=()):
     """执行查询，返回结果"""
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute(sql, params)
-    rows = cur.fetchall()
-    conn.close()
-    return rows
+    return get_db().execute(sql, params).fetchall()
 
 
 def ensure_index(table):
     """为表创建必要索引，加快查询速度"""
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_db()
     cur = conn.cursor()
     try:
-        cur.execute(f"CREATE INDEX IF NOT EXISTS idx_sn_time_{table} ON {table}(FD_INFO_SN, FD_LAST_TM)")
-        cur.execute(f"CREATE INDEX IF NOT EXISTS idx_temp_{table} ON {table}(FD_TEMPERATURE)")
+        cur.execute(f"CREATE INDEX IF NOT EXISTS idx_sn_timedesc_temp_{table} ON {table}(FD_INFO_SN, FD_LAST_TM DESC, FD_TEMPERATURE)")
         conn.commit()
     except Exception as e:
         print(f"⚠️ 创建索引失败 {table}: {e}")
-    conn.close()
 
 
 @app.route("/")
 def index():
-    rows = query("SELECT mo_name, device_count, last_time, warn_count FROM mo_summary")
+    # 只读同步时维护的汇总表，不再逐表扫描
+    try:
+        rows = query("SELECT mo_name, device_count, last_time, warn_count FROM mo_summary")
+    except sqlite3.OperationalError:
+        rows = []  # 尚未同步过，汇总表还不存在
     result = []
     for r in rows:
         result.append({
@@ -84,7 +117,7 @@ def sn_list(mo):
 @app.route("/<mo>/<sn>")
 def sn_curve(mo, sn):
     ensure_index(mo)
-    # 只取最近 2000 条，避免浏览器卡死
+    # 只取最近 2000 条，避免浏览器卡死（打开页面时现查，走覆盖索引）
     rows = query(
         f"""
         SELECT FD_LAST_TM, FD_TEMPERATURE
@@ -100,9 +133,12 @@ def sn_curve(mo, sn):
     times = [r[0] for r in rows]
     temps = [r[1] for r in rows]
 
-    avg_temp = sum(temps) / len(temps) if temps else 0
-    max_temp = max(temps) if temps else 0
-    warn_count = sum(1 for t in temps if t is not None and t >= CONFIG["temperature_threshold"])
+    # 统计值直接用已取出的温度计算（与曲线是同一批数据），空温度记为 NaN 后忽略
+    arr = np.asarray(temps, dtype=float)
+    valid = arr[~np.isnan(arr)]
+    avg_temp = float(valid.mean()) if valid.size else 0
+    max_temp = float(valid.max()) if valid.size else 0
+    warn_count = int(np.count_nonzero(valid >= CONFIG["temperature_threshold"]))
 
     return render_template(
         "sn_curve.html",
@@ -136,60 +172,70 @@ def status():
 @app.route("/<mo>/dist")
 def sn_temp_distribution(mo):
     ensure_index(mo)
-    # 每台 SN 的最高温度
+    # 每台 SN 的最高温度（走覆盖索引，不回表）
     rows = query(f"""
         SELECT FD_INFO_SN, MAX(FD_TEMPERATURE)
         FROM {mo}
         GROUP BY FD_INFO_SN
     """)
-    sns = [r[0] for r in rows if r[0] is not None]
-    max_temps = {r[0]: r[1] for r in rows if r[0] is not None and r[1] is not None}
-
-    # 每台 SN 的前 20 分钟升温速度（限制范围，避免全量扫描）
-    rise_rates = {}
-    for sn in sns:
-        sub = query(f"""
-            SELECT FD_LAST_TM, FD_TEMPERATURE
-            FROM {mo}
-            WHERE FD_INFO_SN=? 
-              AND FD_LAST_TM <= DATETIME(
-                  (SELECT MIN(FD_LAST_TM) FROM {mo} WHERE FD_INFO_SN=?), '+20 minutes'
-              )
-            ORDER BY FD_LAST_TM ASC
-        """, (sn, sn))
-        if len(sub) >= 2:
-            try:
-                t0 = datetime.fromisoformat(str(sub[0][0]))
-                temp0 = sub[0][1]
-                t_end, temp_end = None, None
-                for t, temp in sub:
-                    if not t or temp is None:
-                        continue
-                    try:
-                        t_dt = datetime.fromisoformat(str(t))
-                    except Exception:
-                        t_dt = datetime.strptime(str(t), "%Y-%m-%d %H:%M:%S")
-                    if (t_dt - t0).total_seconds() <= 20 * 60:
-                        t_end, temp_end = t_dt, temp
-                if t_end and temp_end and temp0 is not None:
-                    minutes = (t_end - t0).total_seconds() / 60
-                    if minutes > 0:
-                        rise_rates[sn] = (temp_end - temp0) / minutes
-            except Exception:
-                continue
+    rows = [r for r in rows if r[0] is not None]
+    sns = [r[0] for r in rows]
+    group_max = np.array([r[1] for r in rows], dtype=float)
+    has_max = ~np.isnan(group_max)
+    max_temps = group_max[has_max].tolist()
 
+    # 每台 SN 的前 20 分钟升温速度：只取每台 SN 起始 20 分钟窗口内的采样点
     scatter_x, scatter_y, scatter_labels = [], [], []
-    for sn in sns:
-        if sn in rise_rates and sn in max_temps:
-            scatter_x.append(rise_rates[sn])
-            scatter_y.append(max_temps[sn])
-            scatter_labels.append(sn)
+    win = query(f"""
+        WITH firsts AS (
+            SELECT FD_INFO_SN, MIN(FD_LAST_TM) AS t0
+            FROM {mo}
+            WHERE FD_INFO_SN IS NOT NULL
+            GROUP BY FD_INFO_SN
+        )
+        SELECT m.FD_INFO_SN, m.FD_LAST_TM, m.FD_TEMPERATURE
+        FROM firsts f
+        JOIN {mo} m
+          ON m.FD_INFO_SN = f.FD_INFO_SN
+         AND m.FD_LAST_TM >= f.t0
+         AND m.FD_LAST_TM <= DATETIME(f.t0, '+20 minutes')
+    """) if sns else []
+    if win:
+        sn_index = {sn: i for i, sn in enumerate(sns)}
+        group = np.array([sn_index[r[0]] for r in win])
+        times = np.array([r[1] for r in win], dtype="datetime64[s]").astype(np.int64)
+        temps = np.array([r[2] for r in win], dtype=float)
+
+        # 按 (SN, 时间) 排序后，每台 SN 的窗口数据连续存放，第一行即起始点
+        order = np.lexsort((times, group))
+        group, times, temps = group[order], times[order], temps[order]
+        present, starts = np.unique(group, return_index=True)
+        t0, temp0 = times[starts], temps[starts]
+
+        # 窗口内最后一个有温度的采样点
+        idx = np.where(np.isnan(temps), -1, np.arange(len(temps)))
+        end = np.maximum.reduceat(idx, starts)
+        found = end >= starts
+        end = np.maximum(end, 0)
+
+        minutes = (times[end] - t0) / 60
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rates = (temps[end] - temp0) / minutes
+        valid = found & (minutes > 0) & np.isfinite(rates)
+
+        # 升温速度按 sns 顺序对齐，和最高温度一起用掩码筛出两者都有的 SN
+        rise = np.full(len(sns), np.nan)
+        rise[present[valid]] = rates[valid]
+        both = ~np.isnan(rise) & has_max
+        scatter_x = rise[both].tolist()
+        scatter_y = group_max[both].tolist()
+        scatter_labels = [sns[i] for i in np.flatnonzero(both)]
 
     return render_template(
         "sn_distribution.html",
         mo=mo,
         sns=sns,
-        temps=list(max_temps.values()),
+        temps=max_temps,
         scatter_x=scatter_x,
         scatter_y=scatter_y,
         scatter_labels=scatter_labels,